@@ -1,13 +1,19 @@
 """Main script."""
 
+import argparse
+
 from src.planet import Planet
 from src.render import Window
 from src.texture import generate_texture
 
 
-def planetmake():
-    """Initialize, draw and animate a planet."""
-    texture = generate_texture(shape=1024)
+def planetmake(seed=None):
+    """Initialize, draw and animate a planet.
+
+    Args:
+        seed (int, optional): Random seed of the planet texture. Defaults to None.
+    """
+    texture = generate_texture(shape=1024, seed=seed)
 
     window = Window(path_backgound="./assets/background.png")
     planet = Planet(1.0, texture)
@@ -16,4 +22,8 @@ def planetmake():
 
 
 if __name__ == "__main__":
-    planetmake()
+    parser = argparse.ArgumentParser(description="Planet generator using procedural generation.")
+    parser.add_argument("--seed", type=int, default=None, help="random seed, seeded textures are cached on disk")
+    args = parser.parse_args()
+
+    planetmake(args.seed)
@@ -0,0 +1,11 @@
+"""Planet generator package.
+
+PyOpenGL flags must be set before any OpenGL module is imported: per-call error, context and array size checks
+are disabled since they dominate the cost of the small OpenGL calls issued each frame.
+"""
+
+import OpenGL
+
+OpenGL.ERROR_CHECKING = False
+OpenGL.CONTEXT_CHECKING = False
+OpenGL.ARRAY_SIZE_CHECKING = False
@@ -8,8 +8,15 @@ License: MIT License
 This file contains Perlin noise functions adapted for this project.
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import numpy as np
 
+# default cap on octave worker threads, each worker holds its own accumulator and four scratch buffers
+max_workers = 4
+
 
 def _fade(t):
     """Smoothstep function used in Perlin noise interpolation.
@@ -20,72 +27,140 @@ def _fade(t):
     Returns:
         np.array: Smoothed array.
     """
-    return t * t * t * (t * (t * 6 - 15) + 10)
+    # horner form ((6t - 15)t + 10)t³ evaluated in place in a single buffer
+    out = 6 * t
+    out -= 15
+    out *= t
+    out += 10
+    out *= t
+    out *= t
+    out *= t
+    return out
 
 
-def _perlin_2d(shape, res, tileable=(False, False), seed=42):
-    """Generate single octave perlin noise.
+def _corner_dot(out, tmp, gradients_x, gradients_y, rows, cols, x, y):
+    """Compute in place the dot product between corner gradients and offset vectors.
 
     Args:
-        shape (tuple): Output array shape (height, width)
-        res (tuple): Base resolution of noise (cells along each axis).
-        tileable (tuple, optional): Make noise tilable along an axis (avoid begin/end discontinuity).
-            Defaults to (False, False).
-        seed (int, optional): Random seed. Defaults to 42.
+        out (np.array): Output buffer of shape (height, width).
+        tmp (np.array): Scratch buffer of shape (height, width).
+        gradients_x (np.array): Gradients x components of shape (res[0] + 1, res[1] + 1).
+        gradients_y (np.array): Gradients y components of shape (res[0] + 1, res[1] + 1).
+        rows (np.array): Gradient row index of each output row, of shape (height,).
+        cols (np.array): Gradient col index of each output col, of shape (width,).
+        x (np.array): Offset x components of shape (height, 1).
+        y (np.array): Offset y components of shape (1, width).
 
     Returns:
-        np.array: Single octaves perlin noise of 2D shape.
+        np.array: Output buffer filled with dot products.
     """
-    np.random.seed(seed)
+    np.take(gradients_x[rows], cols, axis=1, out=out)
+    out *= x
+    np.take(gradients_y[rows], cols, axis=1, out=tmp)
+    tmp *= y
+    out += tmp
+    return out
+
 
-    # compute the step size for interpolation between grid points
-    delta = (res[0] / shape[0], res[1] / shape[1])
+@lru_cache(maxsize=32)
+def _cell_grid(shape, res):
+    """Compute the seed independent cell indices, offsets and fade weights of an octave. Results are cached
+    since every noise map of a texture shares the same (shape, res) octaves.
 
+    Args:
+        shape (tuple): Output array shape (height, width).
+        res (tuple): Resolution of noise (cells along each axis).
+
+    Returns:
+        tuple: Read-only arrays (ci, ci + 1, cj, cj + 1, u, u - 1, v, v - 1, smoothed_u, smoothed_v).
+    """
     # compute number of grid points along each axis
     d = (shape[0] // res[0], shape[1] // res[1])
 
-    # create a grid of point offset coordinates of shape (height, width, 2) with values in [0,1) range
-    # each point has a x and y offset inside its cell so grid give the relative position vector from
-    # the top-left corner of the current cell
-    grid = np.mgrid[0:res[0]:delta[0], 0:res[1]:delta[1]]
-    grid = np.transpose(grid, (1, 2, 0)) % 1
+    # compute point offset coordinates with values in [0,1) range along each axis
+    # each point has a x (row) and y (col) offset inside its cell so (u, v) give the relative position vector
+    # from the top-left corner of the current cell, u of shape (height, 1) and v of shape (1, width)
+    u = ((np.arange(shape[0]) % d[0]).astype(np.float32) / d[0])[:, None]
+    v = ((np.arange(shape[1]) % d[1]).astype(np.float32) / d[1])[None, :]
+
+    # cell index of each output row/col, used to gather corner gradients without repeating the grid
+    ci = np.arange(shape[0]) // d[0]
+    cj = np.arange(shape[1]) // d[1]
+
+    # fade is only evaluated on the 1D offsets, broadcasting expands it to the 2D grid
+    smoothed_u = _fade(u)
+    smoothed_v = _fade(v)
+
+    grid = (ci, ci + 1, cj, cj + 1, u, u - 1, v, v - 1, smoothed_u, smoothed_v)
+    for array in grid:
+        array.flags.writeable = False
+
+    return grid
+
+
+def _perlin_2d(noise, scratch, res, amplitude=1.0, tileable=(False, False), seed=42):
+    """Generate single octave perlin noise and accumulate it in place.
+
+    Args:
+        noise (np.array): Float32 accumulation array of shape (height, width).
+        scratch (tuple): Four float32 scratch buffers of shape (height, width), overwritten.
+        res (tuple): Base resolution of noise (cells along each axis).
+        amplitude (float, optional): Octave amplitude. Defaults to 1.0.
+        tileable (tuple, optional): Make noise tilable along an axis (avoid begin/end discontinuity).
+            Defaults to (False, False).
+        seed (int, optional): Random seed. Defaults to 42.
+
+    Returns:
+        np.array: Accumulation array with single octave perlin noise added.
+    """
+    rng = np.random.default_rng(seed)
+    ci0, ci1, cj0, cj1, u0, u1, v0, v1, smoothed_u, smoothed_v = _cell_grid(noise.shape, res)
 
     # generate random gradients vectors for each grid coordinate
-    # random angles between in [0, 2π] range as unit vectors with cos/sin
-    angles = 2 * np.pi * np.random.rand(res[0] + 1, res[1] + 1)
-    gradients = np.dstack((np.cos(angles), np.sin(angles)))
+    # normalized 2D gaussian samples are unit vectors with uniformly distributed directions (no cos/sin needed)
+    # x and y components are kept as separate planes so dot products are computed component-wise
+    gradients = rng.standard_normal((2, res[0] + 1, res[1] + 1), dtype=np.float32)
+    gradients /= np.sqrt(gradients[0] ** 2 + gradients[1] ** 2)
+    gradients_x, gradients_y = gradients
 
     # if tiling copy last row/col to avoid discontinuity
     if tileable[0]:
-        gradients[-1, :] = gradients[0, :]
+        gradients_x[-1, :] = gradients_x[0, :]
+        gradients_y[-1, :] = gradients_y[0, :]
     if tileable[1]:
-        gradients[:, -1] = gradients[:, 0]
-
-    # repeat gradients to match the shape of the output grid
-    gradients = gradients.repeat(d[0], 0).repeat(d[1], 1)
-
-    # get vectors at each grid corners
-    gradient_top_left = gradients[:-d[0], :-d[1]]
-    gradient_bottom_left = gradients[d[0]:, :-d[1]]
-    gradient_top_right = gradients[:-d[0], d[1]:]
-    gradient_bottom_right = gradients[d[0]:, d[1]:]
+        gradients_x[:, -1] = gradients_x[:, 0]
+        gradients_y[:, -1] = gradients_y[:, 0]
 
     # compute dot product of gradient and vector from corners
     # represent how much each corner pulls the value at the point inside the cell
-    dot_top_left = np.sum(np.dstack((grid[:, :, 0], grid[:, :, 1])) * gradient_top_left, 2)
-    dot_bottom_left = np.sum(np.dstack((grid[:, :, 0] - 1, grid[:, :, 1])) * gradient_bottom_left, 2)
-    dot_top_right = np.sum(np.dstack((grid[:, :, 0], grid[:, :, 1] - 1)) * gradient_top_right, 2)
-    dot_bottom_right = np.sum(np.dstack((grid[:, :, 0] - 1, grid[:, :, 1] - 1)) * gradient_bottom_right, 2)
+    # interpolation is written as a + t * (b - a) and done in place in the scratch buffers
+    n0, n1, dot, tmp = scratch
+
+    _corner_dot(n0, tmp, gradients_x, gradients_y, ci0, cj0, u0, v0)
+    _corner_dot(dot, tmp, gradients_x, gradients_y, ci1, cj0, u1, v0)
+    dot -= n0
+    dot *= smoothed_u
+    n0 += dot
+
+    _corner_dot(n1, tmp, gradients_x, gradients_y, ci0, cj1, u0, v1)
+    _corner_dot(dot, tmp, gradients_x, gradients_y, ci1, cj1, u1, v1)
+    dot -= n1
+    dot *= smoothed_u
+    n1 += dot
 
     # interpolate to find perlin noise values for (height, width) grid
-    smoothed_grid = _fade(grid)
-    n0 = dot_top_left * (1 - smoothed_grid[:, :, 0]) + smoothed_grid[:, :, 0] * dot_bottom_left
-    n1 = dot_top_right * (1 - smoothed_grid[:, :, 0]) + smoothed_grid[:, :, 0] * dot_bottom_right
+    n1 -= n0
+    n1 *= smoothed_v
+    n0 += n1
 
-    return np.sqrt(2) * ((1 - smoothed_grid[:, :, 1]) * n0 + smoothed_grid[:, :, 1] * n1)
+    n0 *= np.float32(np.sqrt(2) * amplitude)
+    noise += n0
+    return noise
 
 
-def perlin_noise_2d(shape, res, octaves=1, persistence=0.5, lacunarity=2.0, tileable=(False, False), seed=42):
+def perlin_noise_2d(
+    shape, res, octaves=1, persistence=0.5, lacunarity=2.0, tileable=(False, False), seed=42, workers=None
+):
     """Generate multiple octaves perlin noise.
 
     Args:
@@ -97,21 +172,53 @@ def perlin_noise_2d(shape, res, octaves=1, persistence=0.5, lacunarity=2.0, tile
         tileable (tuple, optional): Make noise tilable along an axis (avoid begin/end discontinuity).
             Defaults to (False, False).
         seed (int, optional): Random seed. Defaults to 42.
+        workers (int, optional): Maximum number of threads summing octaves. Defaults to None, at most max_workers
+            threads (bounded by octaves and CPU count).
+
+    Raises:
+        ValueError: An octave resolution does not evenly divide the output shape.
 
     Returns:
         np.array: Multiple octaves perlin noise of 2D shape.
     """
-    noise = np.zeros(shape)
-
     # multipliers for each octave
     frequency, amplitude = 1, 1
 
-    # sum multiple octaves of perlin noise
+    octaves_params = []
     for _ in range(octaves):
-        noise += amplitude * _perlin_2d(shape, (int(frequency * res[0]), int(frequency * res[1])), tileable, seed)
+        octave_res = (int(frequency * res[0]), int(frequency * res[1]))
+
+        # each cell must span a whole number of points, otherwise cell sizes are zero or uneven
+        if any(r <= 0 or s % r for s, r in zip(shape, octave_res)):
+            raise ValueError(f"Octave resolution {octave_res} must evenly divide shape {tuple(shape)}")
+
+        octaves_params.append((octave_res, amplitude))
 
         # update multipliers values
         frequency *= lacunarity
         amplitude *= persistence
 
+    def accumulate(octaves_group):
+        # each worker sums its octaves in its own accumulator and scratch buffers (allocated once per worker)
+        noise = np.zeros(shape, dtype=np.float32)
+        scratch = tuple(np.empty(shape, dtype=np.float32) for _ in range(4))
+
+        for octave_res, octave_amplitude in octaves_group:
+            _perlin_2d(noise, scratch, octave_res, octave_amplitude, tileable, seed)
+
+        return noise
+
+    # octaves are independent so they are spread over threads (numpy releases the GIL)
+    # worker count is capped since every worker allocates five full size buffers
+    if workers is None:
+        workers = max_workers
+    workers = max(1, min(octaves, workers, os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        partial_noises = list(executor.map(accumulate, [octaves_params[i::workers] for i in range(workers)]))
+
+    # sum multiple octaves of perlin noise
+    noise = partial_noises[0]
+    for partial_noise in partial_noises[1:]:
+        noise += partial_noise
+
     return noise
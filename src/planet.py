@@ -1,31 +1,94 @@
 """Planet class."""
 
-from OpenGL.GL import (GL_LINEAR, GL_RGBA, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_TEXTURE_MIN_FILTER,
-                       GL_UNSIGNED_BYTE, glBindTexture, glGenTextures, glPopMatrix, glPushMatrix, glRotatef,
-                       glTexImage2D, glTexParameteri)
-from OpenGL.GLU import gluNewQuadric, gluQuadricTexture, gluSphere
+import numpy as np
+from OpenGL.GL import (GL_CLAMP_TO_EDGE, GL_COMPILE, GL_FRAGMENT_SHADER, GL_LINEAR, GL_PIXEL_UNPACK_BUFFER, GL_REPEAT,
+                       GL_RGBA, GL_STREAM_DRAW, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_TEXTURE_MIN_FILTER,
+                       GL_TEXTURE_WRAP_S, GL_TEXTURE_WRAP_T, GL_TRUE, GL_UNSIGNED_BYTE, GL_VERTEX_SHADER, glBindBuffer,
+                       glBindTexture, glBufferData, glCallList, glEndList, glGenBuffers, glGenLists, glGenTextures,
+                       glGetUniformLocation, glNewList, glTexImage2D, glTexParameteri, glTexSubImage2D,
+                       glUniformMatrix4fv, glUseProgram)
+from OpenGL.GL.shaders import compileProgram, compileShader
+from OpenGL.GLU import gluDeleteQuadric, gluNewQuadric, gluQuadricTexture, gluSphere
+
+# rotate vertices and normals with the planet rotation matrix on GPU, then apply camera modelview
+_vertex_shader = """
+#version 120
+
+uniform mat4 rotation;
+
+varying vec3 normal;
+varying vec3 position;
+
+void main() {
+    vec4 vertex = rotation * gl_Vertex;
+
+    // eye space position and normal for lighting (rotation is orthonormal so it also applies to normals)
+    position = vec3(gl_ModelViewMatrix * vertex);
+    normal = gl_NormalMatrix * (mat3(rotation) * gl_Normal);
+
+    gl_TexCoord[0] = gl_MultiTexCoord0;
+    gl_Position = gl_ModelViewProjectionMatrix * vertex;
+}
+"""
+
+# phong shading using the light and material set by Camera.set_shading, modulated by the planet texture
+_fragment_shader = """
+#version 120
+
+uniform sampler2D planet_texture;
+
+varying vec3 normal;
+varying vec3 position;
+
+void main() {
+    vec3 n = normalize(normal);
+
+    // light position is stored in eye space, w=0 for a directional light and w=1 for a positional light
+    vec3 l = normalize(gl_LightSource[0].position.xyz - position * gl_LightSource[0].position.w);
+    // half vector with an infinite viewer, as the fixed-function pipeline
+    vec3 h = normalize(l + vec3(0.0, 0.0, 1.0));
+
+    float diffuse = max(dot(n, l), 0.0);
+    float specular = diffuse > 0.0 ? pow(max(dot(n, h), 0.0), gl_FrontMaterial.shininess) : 0.0;
+
+    vec4 color = gl_FrontLightModelProduct.sceneColor + gl_FrontLightProduct[0].ambient
+        + gl_FrontLightProduct[0].diffuse * diffuse + gl_FrontLightProduct[0].specular * specular;
+    color = vec4(clamp(color.rgb, 0.0, 1.0), gl_FrontMaterial.diffuse.a);
+
+    gl_FragColor = texture2D(planet_texture, gl_TexCoord[0].st) * color;
+}
+"""
 
 
 class Planet:
     """A class representing a 3D textured sphere (planet) using OpenGL."""
 
-    def __init__(self, radius, texture):
-        """Initialize planet.
+    def __init__(self, radius, texture, slices=128, stacks=128):
+        """Initialize planet. Sphere tessellation is independent of the texture resolution since the texture is
+        sampled per fragment.
 
         Args:
             radius (float): Radius of the sphere.
             texture (np.array): Planet texture of shape (H, W, 4).
+            slices (int, optional): Number of subdivisions around the z axis (longitude). Defaults to 128.
+            stacks (int, optional): Number of subdivisions along the z axis (latitude). Defaults to 128.
         """
-        height, width, _ = texture.shape
-
         self.radius = radius
-        self.slices = height
-        self.stacks = width
+        self.slices = slices
+        self.stacks = stacks
 
         self.texture = texture
         self.texture_id = None
+        self.pixel_buffer_id = None
         self.__load_texture()
 
+        self.sphere_list_id = None
+        self.__build_sphere()
+
+        self.program = None
+        self.rotation_location = None
+        self.__build_program()
+
     def __load_texture(self):
         """Load planet OpenGL texture."""
         # generate a new texture ID
@@ -34,7 +97,7 @@ class Planet:
         # bind texture so that next commands affect it
         glBindTexture(GL_TEXTURE_2D, texture_id)
 
-        # generate texture image
+        # allocate texture storage once without uploading data
         glTexImage2D(
             GL_TEXTURE_2D,  # define 2D texture target
             0,  # base value level = 0
@@ -44,53 +107,117 @@ class Planet:
             0,  # no image border
             GL_RGBA,
             GL_UNSIGNED_BYTE,
-            self.texture,
+            None,
         )
 
         # apply filters if texture is larger/smaller that sphere (using linear interpolation)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
         glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
 
+        # texture is tileable along longitude so filtering wraps at the seam, latitude is clamped at the poles
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+
         self.texture_id = texture_id
 
-    def __draw(self):
-        """Draw planet geometry and texture."""
+        # pixel buffer object used to stage texture uploads
+        self.pixel_buffer_id = glGenBuffers(1)
 
-        # bind planet texture so the sphere will use it
+        # upload texture image in the allocated storage
+        self.update_texture(self.texture)
+
+    def update_texture(self, texture):
+        """Upload new planet texture data in the existing OpenGL texture storage.
+
+        Args:
+            texture (np.array): Planet texture of shape (H, W, 4), same shape as the current texture.
+
+        Raises:
+            ValueError: Texture shape differs from the allocated texture shape.
+        """
+        if texture.shape != self.texture.shape:
+            raise ValueError(f"Texture shape must be {self.texture.shape}, found {texture.shape}")
+
+        # make sure data is contiguous uint8 so PyOpenGL uploads it without a hidden conversion copy
+        # keep a reference on it so it is not garbage collected during upload
+        self.texture = np.ascontiguousarray(texture, dtype=np.uint8)
+
+        # copy data in the pixel buffer object so the driver can transfer it to the texture asynchronously
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.pixel_buffer_id)
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, self.texture.nbytes, self.texture, GL_STREAM_DRAW)
+
+        # overwrite texture image without reallocating GPU storage
+        # with a bound pixel buffer object, data argument is an offset in the buffer instead of a CPU pointer
         glBindTexture(GL_TEXTURE_2D, self.texture_id)
+        glTexSubImage2D(
+            GL_TEXTURE_2D,
+            0,  # base value level = 0
+            0,  # x offset
+            0,  # y offset
+            self.texture.shape[1],
+            self.texture.shape[0],
+            GL_RGBA,
+            GL_UNSIGNED_BYTE,
+            None,
+        )
+
+        # unbind pixel buffer object so other texture uploads read from CPU memory again
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def __build_sphere(self):
+        """Tessellate planet geometry once and record it in an OpenGL display list."""
+        sphere_list_id = glGenLists(1)
+
         # create quadric object (helper to create spheres or cylinders)
         quad = gluNewQuadric()
 
-        # enable texture and dra object
+        # enable texture and record the sphere draw commands
         gluQuadricTexture(quad, True)
+        glNewList(sphere_list_id, GL_COMPILE)
         gluSphere(quad, self.radius, self.slices, self.stacks)
+        glEndList()
+
+        gluDeleteQuadric(quad)
+
+        self.sphere_list_id = sphere_list_id
+
+    def __draw(self):
+        """Draw planet geometry and texture."""
+
+        # bind planet texture so the sphere will use it
+        glBindTexture(GL_TEXTURE_2D, self.texture_id)
+
+        # replay the recorded sphere geometry
+        glCallList(self.sphere_list_id)
+
+    def __build_program(self):
+        """Compile the planet shader program and fetch its uniform locations."""
+        self.program = compileProgram(
+            compileShader(_vertex_shader, GL_VERTEX_SHADER),
+            compileShader(_fragment_shader, GL_FRAGMENT_SHADER),
+        )
+        self.rotation_location = glGetUniformLocation(self.program, "rotation")
 
-    def __rotate(self, angle, x, y, z):
-        """Apply rotation on planet.
+    def __rotate(self, matrix):
+        """Apply rotation on planet, the matrix is uploaded as a uniform and applied by the vertex shader.
 
         Args:
-            angle (float): Angle of rotation (degrees).
-            x (float): Component x of the rotation axis.
-            y (float): Component y of the rotation axis.
-            z (float): Component z of the rotation axis.
+            matrix (np.array): Float32 rotation matrix of shape (4, 4), row-major.
         """
-        glRotatef(angle, x, y, z)
+        # matrix is row-major so OpenGL transposes it on upload
+        glUniformMatrix4fv(self.rotation_location, 1, GL_TRUE, matrix)
 
-    def draw_and_rotate(self, angle, x, y, z):
+    def draw_and_rotate(self, matrix):
         """Draw and rotate planet.
 
         Args:
-            angle (float): Angle of rotation (degrees).
-            x (float): Component x of the rotation axis.
-            y (float): Component y of the rotation axis.
-            z (float): Component z of the rotation axis.
+            matrix (np.array): Float32 rotation matrix of shape (4, 4), row-major.
         """
-        # save current transformation matrix
-        glPushMatrix()
+        glUseProgram(self.program)
 
         # rotate and draw
-        self.__rotate(angle, x, y, z)
+        self.__rotate(matrix)
         self.__draw()
 
-        # restore the transformation matrix
-        glPopMatrix()
+        # restore fixed-function pipeline for other draws (background)
+        glUseProgram(0)
@@ -1,15 +1,23 @@
 """Classes used to create window and render 3D object(s)."""
 
+import math
+import queue
+import threading
+import time
+
+import numpy as np
 import pygame
-from OpenGL.GL import (GL_AMBIENT, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_DIFFUSE, GL_FRONT,
-                       GL_LIGHT0, GL_LIGHTING, GL_LINEAR, GL_MODELVIEW, GL_POSITION, GL_PROJECTION, GL_QUADS, GL_RGBA,
-                       GL_SHININESS, GL_SPECULAR, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_TEXTURE_MIN_FILTER,
-                       GL_UNSIGNED_BYTE, glBegin, glBindTexture, glClear, glClearColor, glDisable, glEnable, glEnd,
-                       glGenTextures, glLightfv, glLoadIdentity, glMaterialfv, glMatrixMode, glOrtho, glPopMatrix,
-                       glPushMatrix, glTexCoord2f, glTexImage2D, glTexParameteri, glVertex2f)
-from OpenGL.GLU import gluLookAt, gluPerspective
+from OpenGL.GL import (GL_AMBIENT, GL_COLOR_BUFFER_BIT, GL_COMPILE, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, GL_DIFFUSE,
+                       GL_FRONT, GL_LIGHT0, GL_LIGHTING, GL_LINEAR, GL_MODELVIEW, GL_POSITION, GL_PROJECTION, GL_QUADS,
+                       GL_RGBA, GL_SHININESS, GL_SPECULAR, GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_TEXTURE_MIN_FILTER,
+                       GL_UNSIGNED_BYTE, glBegin, glBindTexture, glCallList, glClear, glClearColor, glDisable, glEnable,
+                       glEnd, glEndList, glGenLists, glGenTextures, glLightfv, glLoadIdentity, glLoadMatrixf,
+                       glMaterialfv, glMatrixMode, glNewList, glOrtho, glPopMatrix, glPushMatrix, glTexCoord2f,
+                       glTexImage2D, glTexParameteri, glVertex2f, glViewport)
 from pygame.locals import DOUBLEBUF, OPENGL, QUIT
 
+from src.utils import look_at_matrix, perspective_matrix
+
 _cam_params = {
     "cam_eye": [0, -5, 2],
     "cam_center": [0, 0, 0],
@@ -35,17 +43,24 @@ class Camera:
             path_background (str, optional): Background path. Defaults to None.
         """
         self.backgroung_id = None
+        self.background_list_id = None
         self.window_width = window_width
         self.window_height = window_height
+        self._aspect = window_width / window_height
 
-        # enable OpenGL textures, lighning and depth buffer
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_TEXTURE_2D)
-        glEnable(GL_LIGHTING)
-        glEnable(GL_LIGHT0)
+        # projection and view matrices in OpenGL column-major layout
+        self._proj = None
+        self._view = None
+
+        # last values set through glLightfv/glMaterialfv, used to skip redundant state changes
+        self._state_cache = {}
 
         if path_background is not None:
             self.backgroung_id = self.__load_background(path_background)
+            self.background_list_id = self.__build_background()
+
+        # projection only depends on the window size so it is set once here (and on resize)
+        self.set_projection()
 
     def __load_background(self, path_background):
         """Load backgound texture.
@@ -74,8 +89,14 @@ class Camera:
 
         return texture_id
 
-    def draw_background(self):
-        """Draw background texture."""
+    def __build_background(self):
+        """Record background drawing commands in an OpenGL display list.
+
+        Returns:
+            int: Display list ID.
+        """
+        background_list_id = glGenLists(1)
+        glNewList(background_list_id, GL_COMPILE)
 
         # disable depth and lightining so the quad is always drawn
         glDisable(GL_DEPTH_TEST)
@@ -115,6 +136,14 @@ class Camera:
         glEnable(GL_LIGHTING)
         glEnable(GL_DEPTH_TEST)
 
+        glEndList()
+
+        return background_list_id
+
+    def draw_background(self):
+        """Draw background texture."""
+        glCallList(self.background_list_id)
+
     def set_shading(
         self,
         light_position,
@@ -143,70 +172,118 @@ class Camera:
         # define light coords
         # if w=0, the light is directional: the (x,y,z) vector defines its direction
         # if w=1, the light is positional: the (x,y,z) defines its location in world space
-        glLightfv(GL_LIGHT0, GL_POSITION, light_position)
+        self.__set_state(glLightfv, GL_LIGHT0, GL_POSITION, light_position)
 
         # sets diffuse, specular and ambient light colors
-        glLightfv(GL_LIGHT0, GL_DIFFUSE, light_color)
-        glLightfv(GL_LIGHT0, GL_SPECULAR, light_color)
-        glLightfv(GL_LIGHT0, GL_AMBIENT, light_ambient_color)
+        self.__set_state(glLightfv, GL_LIGHT0, GL_DIFFUSE, light_color)
+        self.__set_state(glLightfv, GL_LIGHT0, GL_SPECULAR, light_color)
+        self.__set_state(glLightfv, GL_LIGHT0, GL_AMBIENT, light_ambient_color)
 
         # sets diffuse, specular and shininess material colors
-        glMaterialfv(GL_FRONT, GL_DIFFUSE, material_diffuse)
-        glMaterialfv(GL_FRONT, GL_SPECULAR, material_specular)
-        glMaterialfv(GL_FRONT, GL_SHININESS, material_shininess)
+        self.__set_state(glMaterialfv, GL_FRONT, GL_DIFFUSE, material_diffuse)
+        self.__set_state(glMaterialfv, GL_FRONT, GL_SPECULAR, material_specular)
+        self.__set_state(glMaterialfv, GL_FRONT, GL_SHININESS, material_shininess)
+
+    def __set_state(self, gl_setter, target, name, value):
+        """Call an OpenGL light or material setter only if the value changed since its last call. Note that a
+        light position is transformed by the modelview matrix at call time, skipping it assumes that matrix did
+        not change either.
+
+        Args:
+            gl_setter (callable): OpenGL setter (glLightfv or glMaterialfv).
+            target (int): Light or material face (GL_LIGHT0, GL_FRONT, ...).
+            name (int): Parameter name (GL_POSITION, GL_DIFFUSE, ...).
+            value (list): Parameter value.
+        """
+        key = (gl_setter, target, name)
+        value = tuple(value)
+
+        if self._state_cache.get(key) != value:
+            gl_setter(target, name, value)
+            self._state_cache[key] = value
+
+    def set_projection(self):
+        """Compute the perspective projection matrix from the cached aspect ratio and load it."""
+        # projection matrix (fov, aspect ratio, near dist, far dist)
+        # matrices are transposed since OpenGL expects column-major layout
+        self._proj = np.ascontiguousarray(perspective_matrix(45, self._aspect, 0.1, 100.0).T)
+
+        # switch to projection mode (camera lens params) and load projection matrix
+        glMatrixMode(GL_PROJECTION)
+        glLoadMatrixf(self._proj)
+
+        # leave modelview as the current matrix mode for the following draws
+        glMatrixMode(GL_MODELVIEW)
+
+    def resize(self, window_width, window_height):
+        """Update the viewport and projection after a window resize.
+
+        Args:
+            window_width (int): New width of the window (pixels).
+            window_height (int): New height of the window (pixels).
+        """
+        self.window_width = window_width
+        self.window_height = window_height
+        self._aspect = window_width / window_height
 
-    def set_at(self, eye, center, up):
-        """Set the camera's position and orientation.
+        glViewport(0, 0, window_width, window_height)
+        self.set_projection()
+
+    def update_view(self, eye, center, up):
+        """Set the camera's position and orientation, projection is left untouched.
 
         Args:
             eye (list): Coordinates of the camera position.
             center (list): Coordinates of the point the camera is looking at.
             up (list): Components of the up vector to define camera orientation.
         """
-        # set the background clear color
-        glClearColor(0.0, 0.0, 0.0, 1.0)
+        # matrix is transposed since OpenGL expects column-major layout
+        self._view = np.ascontiguousarray(look_at_matrix(eye, center, up).T)
 
-        # switch to projection mode (camera lens params)
-        glMatrixMode(GL_PROJECTION)
-        # replace current proj matrix with identity matrix (avoid matrix multiplication)
-        glLoadIdentity()
-        # set projection matrix (fov, aspect ratio, near dist, far dist)
-        gluPerspective(45, (self.window_width / self.window_height), 0.1, 100.0)
-
-        # switch to the modelview mode (camera position/orientation)
+        # switch to the modelview mode (camera position/orientation) and load view matrix
         glMatrixMode(GL_MODELVIEW)
-        # set view matrix
-        gluLookAt(eye[0], eye[1], eye[2], center[0], center[1], center[2], up[0], up[1], up[2])
+        glLoadMatrixf(self._view)
 
 
 class Window:
     """Class used to create window and render planet."""
 
-    def __init__(self, width=1400, height=1000, path_backgound=None):
+    def __init__(self, width=1400, height=1000, path_backgound=None, vsync=False, fps_limit=60):
         """Initialize render object.
 
         Args:
             width (int, optional): Width of the window (pixels). Defaults to 1400.
             height (int, optional): Height of the window (pixels). Defaults to 1000.
             path_background (str, optional): Background path. Defaults to None.
+            vsync (bool, optional): Pace frames with vertical sync (no tearing, but buffer swap blocks until the
+                vertical blank). Defaults to False.
+            fps_limit (int, optional): Frame rate limit used when vsync is disabled. Defaults to 60.
         """
         pygame.init()
         self.width, self.height = width, height
+        self.vsync = vsync
+        self.fps_limit = fps_limit
+
+        # planet rotation matrix, only its z rotation block is overwritten each frame
+        self._rot_matrix = np.eye(4, dtype=np.float32)
+
+        # create OpenGL window, vsync is explicitly requested or disabled instead of using the driver default
+        pygame.display.set_mode((self.width, self.height), DOUBLEBUF | OPENGL, vsync=int(self.vsync))
+
+        # set the background clear color
+        glClearColor(0.0, 0.0, 0.0, 1.0)
 
-        # create OpenGL window
-        pygame.display.set_mode((self.width, self.height), DOUBLEBUF | OPENGL)
+        # enable OpenGL textures, lighning and depth buffer
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_TEXTURE_2D)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_LIGHT0)
 
         # initialize OpenGL camera
         self.cam = Camera(self.width, self.height, path_backgound)
 
-    def render(self, planet, delta_z=0.1):
-        """Render loop.
-
-        Args:
-            planet (Planet): Planet object to render.
-            delta_z (float, optional): Rotation degree shift by frame. Defaults to 0.1.
-        """
-        # set scene shading
+        # set scene shading once, light and materials do not change between renders
+        # (call self.cam.set_shading to reconfigure it)
         self.cam.set_shading(
             _cam_params["light_position"],
             _cam_params["light_color"],
@@ -215,23 +292,93 @@ class Window:
             _cam_params["material_specular"],
             _cam_params["material_shininess"],
         )
+
+    def __update_pose(self, poses, stop, delta_z, update_rate):
+        """Pose update loop, run in a separate thread so rotation does not depend on frame presentation timing.
+
+        Args:
+            poses (queue.Queue): Queue receiving (rot_z, pose_time) poses, pose_time being the perf_counter time
+                at which rot_z was reached. Oldest pose is dropped when full.
+            stop (threading.Event): Event set to stop the loop.
+            delta_z (float): Rotation degree shift by update step.
+            update_rate (int): Number of update steps per second.
+        """
+        step = 1.0 / update_rate
+
+        rot_z = 0
+        accumulator = 0.0
+        last_time = time.perf_counter()
+
+        while not stop.is_set():
+            # accumulate elapsed time, sleep jitter is carried over instead of skewing the rotation speed
+            now = time.perf_counter()
+            accumulator += now - last_time
+            last_time = now
+
+            # rotate by delta_z degrees for each whole fixed step elapsed
+            while accumulator >= step:
+                rot_z += delta_z
+                accumulator -= step
+
+            # publish latest pose, renderer only needs the most recent one
+            if poses.full():
+                try:
+                    poses.get_nowait()
+                except queue.Empty:
+                    pass
+            poses.put_nowait((rot_z, now - accumulator))
+
+            # wait until next step is due
+            stop.wait(step - accumulator)
+
+    def render(self, planet, delta_z=0.1, update_rate=60):
+        """Render loop. Events, drawing and display stay on the main thread that owns the OpenGL context while
+        planet rotation is updated at a fixed rate by a separate thread.
+
+        Args:
+            planet (Planet): Planet object to render.
+            delta_z (float, optional): Rotation degree shift by update step. Defaults to 0.1.
+            update_rate (int, optional): Number of rotation update steps per second. Defaults to 60.
+        """
         # set camera viewpoint
-        self.cam.set_at(_cam_params["cam_eye"], _cam_params["cam_center"], _cam_params["cam_up"])
+        self.cam.update_view(_cam_params["cam_eye"], _cam_params["cam_center"], _cam_params["cam_up"])
 
-        # clock for frame rate
+        # clock for frame rate when not paced by vsync
         clock = pygame.time.Clock()
 
-        rot_z = 0
+        # start pose update thread
+        poses = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        updater = threading.Thread(target=self.__update_pose, args=(poses, stop, delta_z, update_rate), daemon=True)
+        updater.start()
+
+        # latest published pose, frames advance it continuously from the time it was reached
+        pose_rot_z, pose_time = 0, time.perf_counter()
+        rotation_speed = delta_z * update_rate
         is_running = True
 
         while is_running:
             # define FPS limit
-            clock.tick(60)
-
-            # handle window closing
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    is_running = False
+            if not self.vsync:
+                clock.tick(self.fps_limit)
+
+            # handle window closing, quit events are peeked without building an event list
+            # and other queued events are dropped, peek already pumped the queue so clear must not pump again
+            # (a quit event pumped in between would be dropped without being seen)
+            if pygame.event.peek(QUIT):
+                is_running = False
+            pygame.event.clear(pump=False)
+
+            # fetch latest published pose
+            try:
+                while True:
+                    pose_rot_z, pose_time = poses.get_nowait()
+            except queue.Empty:
+                pass
+
+            # pose only moves in whole delta_z steps on its own clock, rotation speed is constant so the frame
+            # pose is extrapolated from the time elapsed since the latest step (no judder between both clocks)
+            rot_z = pose_rot_z + rotation_speed * (time.perf_counter() - pose_time)
 
             # clears the screen and depth buffers for new frame
             glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -239,11 +386,20 @@ class Window:
             if self.cam.backgroung_id is not None:
                 self.cam.draw_background()
 
-            # rotate by delta_z degrees at each frame
-            rot_z += delta_z
-            planet.draw_and_rotate(rot_z, 0, 0, 1)
+            # rotation around z axis written in the preallocated matrix
+            c, s = math.cos(math.radians(rot_z)), math.sin(math.radians(rot_z))
+            self._rot_matrix[0, 0] = c
+            self._rot_matrix[0, 1] = -s
+            self._rot_matrix[1, 0] = s
+            self._rot_matrix[1, 1] = c
 
-            # update display with new frame
+            planet.draw_and_rotate(self._rot_matrix)
+
+            # update display with new frame (blocks until vertical sync if enabled)
             pygame.display.flip()
 
+        # stop pose update thread
+        stop.set()
+        updater.join()
+
         pygame.quit()
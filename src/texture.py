@@ -1,10 +1,13 @@
 """Procedural generation texture of planet using Perlin Noise."""
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import numpy as np
 from PIL import Image
 
-from src.perlin import perlin_noise_2d
-from src.utils import get_latitude_grid, hex2rgba, random_seed
+from src.perlin import max_workers, perlin_noise_2d
+from src.utils import disk_cache, get_latitudes, hex2rgba, random_seed
 
 _biomes = {
     "ice_ocean": {
@@ -116,8 +119,83 @@ _earth = {
     "max_temp": 35,
 }
 
+# fallback biome matching every pixel, transparent and without noise
+_no_biome = {
+    "color": "#00000000",
+    "max_alti": None,
+    "min_alti": None,
+    "max_temp": None,
+    "min_temp": None,
+    "noise": 0.0,
+}
+
+
+def _biome_field(key):
+    """Gather a parameter of every biome (in priority order, fallback biome last) as a parallel array.
+
+    Args:
+        key (str): Biome parameter name.
+
+    Returns:
+        np.array: Float32 array of shape (n_biomes + 1,).
+    """
+    return np.array([b[key] for b in [*_biomes.values(), _no_biome]], dtype=np.float32)
+
+
+def _biome_bounds(biome):
+    """Gather the finite range bounds of a biome, unbounded (None) parameters are skipped.
+
+    Args:
+        biome (dict): Biome parameters.
+
+    Returns:
+        tuple: Bounds as (map name, comparison ufunc, float32 threshold) tuples, usable as comparison cache keys.
+    """
+    bounds = []
+    for map_name, min_key, max_key in (("altitude", "min_alti", "max_alti"), ("temperature", "min_temp", "max_temp")):
+        if biome[min_key] is not None:
+            bounds.append((map_name, np.greater_equal, np.float32(biome[min_key])))
+        if biome[max_key] is not None:
+            bounds.append((map_name, np.less_equal, np.float32(biome[max_key])))
+    return tuple(bounds)
+
+
+# biome parameters as parallel arrays (SoA) for vectorized classification
+# ranges only keep finite bounds, shared thresholds (ex: altitude >= 0) are compared once per world
+_biome_bounds_list = [_biome_bounds(b) for b in [*_biomes.values(), _no_biome]]
+_biome_noise = _biome_field("noise")
+# float32 palette so the gathered texture is blended in place without another cast
+_biome_colors = np.array([hex2rgba(b["color"]) for b in [*_biomes.values(), _no_biome]], dtype=np.float32)
+
+# cloud RGBA color decoded once
+_cloud_color = np.array(hex2rgba(_clouds["color"]), dtype=np.uint8)
+
+
+@lru_cache(maxsize=4)
+def _latitude_factor(shape):
+    """Return the latitude factor of a map, cached since it only depends on the map shape.
+
+    Args:
+        shape (int): Map shape (shape, shape).
+
+    Returns:
+        np.array: Read-only float32 latitude factor of shape (shape, 1), broadcast along map columns.
+    """
+    # get latitude of each row: ranges from -90° (south pole) to +90° (north pole)
+    # latitude only varies along rows so it is kept as a column instead of a full map
+    latitude_map = get_latitudes(shape)[:, None]
+
+    # compute latitude factor
+    # equator (0°): cos(0) = 1
+    # poles (90° or -90°): cos(90) or cos(-90) = 0
+    latitude_factor = np.cos(np.radians(latitude_map)).astype(np.float32)
+    latitude_factor.setflags(write=False)
+    return latitude_factor
+
 
-def generate_noise(shape, res, octaves=8, persistence=0.5, lacunarity=2.0, tileable=(True, True), seed=None):
+def generate_noise(
+    shape, res, octaves=8, persistence=0.5, lacunarity=2.0, tileable=(False, True), seed=None, workers=None
+):
     """Generate [0, 1] range perlin noise.
 
     Args:
@@ -127,8 +205,9 @@ def generate_noise(shape, res, octaves=8, persistence=0.5, lacunarity=2.0, tilea
         persistence (float, optional): Amplitude multiplier for each successive octave. Defaults to 0.5.
         lacunarity (float, optional): _descrFrequency multiplier for each successive octaveiption_. Defaults to 2.0.
         tileable (tuple, optional): Make noise tilable along an axis (avoid begin/end discontinuity).
-            Defaults to (True, True).
+            Defaults to (False, True), only the width (longitude) wraps around the sphere.
         seed (int, optional): Random seed. Defaults to None.
+        workers (int, optional): Maximum number of threads summing octaves. Defaults to None (perlin default).
 
     Returns:
         np.array: Perlin noise of shape (shape, shape) in [0, 1] range.
@@ -136,11 +215,19 @@ def generate_noise(shape, res, octaves=8, persistence=0.5, lacunarity=2.0, tilea
     if seed is None:
         seed = random_seed()
 
-    noise_map = perlin_noise_2d((shape, shape), (res, res), octaves, persistence, lacunarity, tileable, seed)
-    return (noise_map - np.min(noise_map)) / (np.max(noise_map) - np.min(noise_map))
+    noise_map = perlin_noise_2d(
+        (shape, shape), (res, res), octaves, persistence, lacunarity, tileable, seed, workers=workers
+    )
+    noise_map = noise_map.astype(np.float32, copy=False)
+
+    # min-max normalization in place, min and max are only computed once
+    noise_min, noise_max = noise_map.min(), noise_map.max()
+    noise_map -= noise_min
+    noise_map *= 1.0 / (noise_max - noise_min)
+    return noise_map
 
 
-def generate_altitude_map(min_alt, max_alt, shape, res, seed=None):
+def generate_altitude_map(min_alt, max_alt, shape, res, seed=None, workers=None):
     """Generate a procedural altitude map using perlin noise.
 
     Args:
@@ -149,6 +236,7 @@ def generate_altitude_map(min_alt, max_alt, shape, res, seed=None):
         shape (int): Output array shape (shape, shape).
         res (int): Base resolution of noise (cells along each axis).
         seed (int, optional): Random seed. Defaults to None.
+        workers (int, optional): Maximum number of threads summing noise octaves. Defaults to None.
 
     Raises:
         ValueError: Min and/or max altitude value(s) are not valid.
@@ -159,19 +247,20 @@ def generate_altitude_map(min_alt, max_alt, shape, res, seed=None):
     if min_alt > 0 or max_alt < 0:
         raise ValueError(f"Min and/or max altitude value(s) are not valid, found [{min_alt}, {max_alt}]")
 
-    noise_map = generate_noise(shape, res, seed=seed)
-    altitude_map = np.zeros_like(noise_map)
+    noise_map = generate_noise(shape, res, seed=seed, workers=workers)
 
     # scale land values from ]0.5, 1] to ]0, max_alt] and water values for [0, 0.5] to [min_alt, 0]
-    msk_land = noise_map > 0.5
-    msk_water = noise_map <= 0.5
-    altitude_map[msk_land] = ((noise_map[msk_land] - 0.5) / 0.5) * max_alt
-    altitude_map[msk_water] = ((noise_map[msk_water] - 0.5) / 0.5) * abs(min_alt)
+    # both branches are linear and zero at 0.5, so only the scale factor depends on the pixel side
+    scale = np.where(noise_map > 0.5, np.float32(max_alt), np.float32(abs(min_alt)))
+    altitude_map = noise_map
+    altitude_map -= 0.5
+    altitude_map *= 2
+    altitude_map *= scale
 
     return altitude_map
 
 
-def generate_temperature_map(min_temp, max_temp, altitude_map, shape, res, lapse_rate=9.2, seed=None):
+def generate_temperature_map(min_temp, max_temp, altitude_map, shape, res, lapse_rate=9.2, seed=None, workers=None):
     """Generate a procedural temperature map using perlin noise. Extrem high values are located on equator
     and low values on poles or in altitude with lapse_rate:
     https://en.wikipedia.org/wiki/Lapse_rate
@@ -184,6 +273,7 @@ def generate_temperature_map(min_temp, max_temp, altitude_map, shape, res, lapse
         res (int): Base resolution of noise (cells along each axis).
         lapse_rate (float, optional): Temperature fall rate with altitude (°C/km). Defaults to 9.2.
         seed (int, optional): Random seed. Defaults to None.
+        workers (int, optional): Maximum number of threads summing noise octaves. Defaults to None.
 
     Raises:
         ValueError: Minimum temperature cannot be higher or equal than maximum temperature.
@@ -194,51 +284,54 @@ def generate_temperature_map(min_temp, max_temp, altitude_map, shape, res, lapse
     if max_temp <= min_temp:
         raise ValueError("Minimum temperature cannot be higher or equal than maximum temperature.")
 
-    noise_map = generate_noise(shape, res, seed=seed)
-
-    # get latitude map: ranges from -90° (south pole) to +90° (north pole)
-    latitude_map = get_latitude_grid(shape, shape)
-
-    # compute latitude factor
-    # equator (0°): cos(0) = 1
-    # poles (90° or -90°): cos(90) or cos(-90) = 0
-    latitude_factor = np.cos(np.radians(latitude_map))
+    noise_map = generate_noise(shape, res, seed=seed, workers=workers)
 
     # interpolate between [min_temp, max_temp] depending on latitude factor (cold at poles, warm at equator)
-    # add local noise variation (scaled between 10°C and -10°C)
-    temperature_map = min_temp + latitude_factor * (max_temp - min_temp) + (noise_map - 0.5) * 20
+    # computed in place in a single output buffer, latitude factor column is broadcast along the map width
+    temperature_map = np.empty((shape, shape), dtype=np.float32)
+    np.multiply(_latitude_factor(shape), np.float32(max_temp - min_temp), out=temperature_map)
+    temperature_map += min_temp
+
+    # add local noise variation (scaled between 10°C and -10°C), noise map is reused as scratch buffer
+    noise_map -= 0.5
+    noise_map *= 20
+    temperature_map += noise_map
 
     # decrease by lapse_rate °C per km (altitude) for land values (altitude > 0)
-    lapse = (np.maximum(0, altitude_map) / 1000.0) * lapse_rate
-    return temperature_map - lapse
+    lapse = np.maximum(altitude_map, 0, out=noise_map)
+    lapse *= lapse_rate / 1000.0
+    temperature_map -= lapse
+    return temperature_map
 
 
-def get_color(texture, msk, color, noise_map, noise=0.6):
-    """Fetch and apply RGBA color to a set of pixels defined by a mask. The RGBA pixel color is modified
+def get_color(texture, msk, color, shade_map, noise=0.6):
+    """Apply RGBA color to a set of pixels defined by a mask. The RGBA pixel color is modified
         pixel-wise based on a noise parameter.
 
     Args:
         texture (np.array): Texture array of shape (H, W, 4).
         msk (np.array): Selection mask.
-        color (str): Hexadecimal RGBA color.
-        noise_map (np.array): Perlin noise map for color shading.
+        color (np.array): RGBA np.uint8 color of shape (4,).
+        shade_map (np.array): Perlin noise map for color shading, rescaled in [-1, 1] range.
         noise (float, optional): Noise intensity. Defaults to 0.6.
 
     Returns:
         np.array: Updated texture np.array of shape (H, W, 4).
     """
-    # apply color on pixel selection
-    texture[msk] = hex2rgba(color)
-
-    # rescale noise values from [0, 1] → [1 - noise, 1 + noise]
+    # rescale noise values from [-1, 1] → [1 - noise, 1 + noise]
     # ex: if noise=0.6, then range is [0.4, 1.6]
     # the higher the noise value is, the higher is the multiplier
-    noise_map = 1 + (noise_map - 0.5) * 2 * noise
+    shade = shade_map * np.float32(noise)
+    shade += 1
+
+    # apply perlin blend on color as a dense float32 image, clipped in place in [0, 255] range
+    blended = np.multiply(color, shade[..., None], dtype=np.float32)
+    np.clip(blended, 0, 255, out=blended)
 
-    # apply perlin blend on float64 and rescale as [0, 255] np.uint8
-    texture = texture.astype(np.float64)
-    texture[msk] = texture[msk] * noise_map[..., None][msk]
-    return np.clip(texture, 0, 255).astype(np.uint8)
+    # copy blended color on pixel selection with a single sequential pass (no gather/scatter on the mask)
+    # the uint8 cast is done while copying so no intermediate uint8 image is allocated
+    np.copyto(texture, blended, where=msk[..., None], casting="unsafe")
+    return texture
 
 
 def alpha_composite(img_1, img_2):
@@ -264,7 +357,7 @@ def alpha_composite(img_1, img_2):
     )
 
 
-def generate_world(altitude_map, temperature_map, cloud_map, shape, res):
+def generate_world(altitude_map, temperature_map, cloud_map, shape, res, seed=None):
     """Generate world texture from perlin noises.
 
     Args:
@@ -273,60 +366,100 @@ def generate_world(altitude_map, temperature_map, cloud_map, shape, res):
         cloud_map (np.array): Cloud map from perlin noise.
         shape (int): Texture shape.
         res (int): Texture generation.
+        seed (int, optional): Random seed of color variations. Defaults to None.
 
     Returns:
         np.array: World texture of shape (shape, shape, 4).
     """
-    # create rgba world and cloud textures
-    world_texture = np.zeros((shape, shape, 4), dtype=np.uint8)
+    # create rgba cloud texture
     cloud_texture = np.zeros((shape, shape, 4), dtype=np.uint8)
 
-    # perlin noise for colors variations
-    color_shade_map = generate_noise(shape, res, persistence=0.8, seed=None)
-
-    # mask of pixels available for selection
-    msk_map = np.ones((shape, shape), dtype=np.bool)
-
-    for biome_params in _biomes.values():
-        # current biome mask
-        msk = np.ones((shape, shape), dtype=np.bool)
-
-        if biome_params["min_alti"] is not None:
-            msk = msk & (biome_params["min_alti"] <= altitude_map)
-
-        if biome_params["max_alti"] is not None:
-            msk = msk & (altitude_map <= biome_params["max_alti"])
-
-        if biome_params["min_temp"] is not None:
-            msk = msk & (biome_params["min_temp"] <= temperature_map)
-
-        if biome_params["max_temp"] is not None:
-            msk = msk & (temperature_map <= biome_params["max_temp"])
-
-        # apply current biome on pixels that have not been selected before
-        msk = msk & msk_map
-        msk_map[msk] = False
-
-        world_texture = get_color(world_texture, msk, biome_params["color"], color_shade_map, biome_params["noise"])
-
-    cloud_texture = get_color(cloud_texture, cloud_map > 0.55, _clouds["color"], color_shade_map, 0.6)
+    # perlin noise for colors variations, rescaled once from [0, 1] to [-1, 1] in place
+    color_shade_map = generate_noise(shape, res, persistence=0.8, seed=seed)
+    color_shade_map -= 0.5
+    color_shade_map *= 2
+
+    # biome index of each pixel (first biome matching its conditions) stored as uint8, a single byte per pixel
+    # pixels start on the fallback biome then biomes are written from lowest to highest priority, so the first
+    # matching biome is the last one written and a single (shape, shape) mask buffer is reused for every biome
+    # each distinct bound is compared once and cached, unbounded ranges are never compared
+    maps = {"altitude": altitude_map, "temperature": temperature_map}
+    comparisons = {}
+    biome_id = np.full((shape, shape), len(_biome_bounds_list) - 1, dtype=np.uint8)
+    msk = np.empty((shape, shape), dtype=bool)
+
+    for i in reversed(range(len(_biome_bounds_list) - 1)):
+        bounds = _biome_bounds_list[i]
+        for bound in bounds:
+            if bound not in comparisons:
+                map_name, compare, threshold = bound
+                comparisons[bound] = compare(maps[map_name], threshold)
+
+        # an unbounded biome matches every pixel so it overrides every lower priority biome
+        if not bounds:
+            biome_id.fill(i)
+            continue
+
+        # mask starts from the first condition and is intersected in place with the others
+        np.copyto(msk, comparisons[bounds[0]])
+        for bound in bounds[1:]:
+            np.logical_and(msk, comparisons[bound], out=msk)
+        np.copyto(biome_id, i, where=msk)
+
+    # rescale noise values from [-1, 1] → [1 - noise, 1 + noise] with the noise intensity of each pixel biome
+    shade_map = _biome_noise[biome_id]
+    shade_map *= color_shade_map
+    shade_map += 1
+
+    # gather float32 biome colors and apply perlin blend in place, then rescale as [0, 255] np.uint8
+    world_texture = _biome_colors[biome_id]
+    world_texture *= shade_map[..., None]
+    np.clip(world_texture, 0, 255, out=world_texture)
+    world_texture = world_texture.astype(np.uint8)
+
+    cloud_texture = get_color(cloud_texture, cloud_map > 0.55, _cloud_color, color_shade_map, 0.6)
 
     # blend clouds and world textures
     return alpha_composite(world_texture, cloud_texture)
 
 
-def generate_texture(shape=1024, res=8):
-    """Generate 2D grid texture from procedural generation using perlin noise.
+@disk_cache
+def generate_texture(shape=1024, res=8, seed=None):
+    """Generate 2D grid texture from procedural generation using perlin noise. Seeded textures are cached on disk.
 
     Args:
         shape (int, optional): Texture shape. Defaults to 1024.
         res (int, optional): Texture generation. Defaults to 8.
+        seed (int, optional): Random seed. Defaults to None.
 
     Returns:
         np.array: Generated texture.
     """
-    altitude_map = generate_altitude_map(_earth["min_alti"], _earth["max_alti"], shape, res)
-    temperature_map = generate_temperature_map(_earth["min_temp"], _earth["max_temp"], altitude_map, shape, res)
-    cloud_map = generate_noise(shape, res, octaves=6, persistence=0.6)
+    # derive one independent seed per noise map (consecutive seeds would share maps between planets)
+    seeds = [None] * 4 if seed is None else [int(s) for s in np.random.SeedSequence(seed).generate_state(4)]
+
+    # at most two noise maps are generated at a time (temperature waits for altitude), they share the default
+    # octave threads budget so nested thread pools do not multiply threads and their full size buffers
+    workers = max(1, max_workers // 2)
+
+    def temperature(altitude_future):
+        # temperature depends on altitude, it waits for the altitude map submitted before it
+        return generate_temperature_map(
+            _earth["min_temp"], _earth["max_temp"], altitude_future.result(), shape, res, seed=seeds[1], workers=workers
+        )
+
+    # noise maps are independent so they are generated concurrently (numpy releases the GIL)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        altitude_future = executor.submit(
+            generate_altitude_map, _earth["min_alti"], _earth["max_alti"], shape, res, seed=seeds[0], workers=workers
+        )
+        temperature_future = executor.submit(temperature, altitude_future)
+        cloud_future = executor.submit(
+            generate_noise, shape, res, octaves=6, persistence=0.6, seed=seeds[2], workers=workers
+        )
+
+        altitude_map = altitude_future.result()
+        temperature_map = temperature_future.result()
+        cloud_map = cloud_future.result()
 
-    return generate_world(altitude_map, temperature_map, cloud_map, shape, res)
+    return generate_world(altitude_map, temperature_map, cloud_map, shape, res, seed=seeds[3])
@@ -1,9 +1,21 @@
 """Utility functions."""
 
+import functools
+import hashlib
+import inspect
+import json
+import os
 import random
+import tempfile
 
 import numpy as np
 
+_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+_cache_dir = os.path.join(_cache_home, "planetmake")
+
+# part of every disk cache key, bump it whenever a cached function output changes for the same arguments
+_cache_version = 1
+
 
 def hex2rgba(hexa):
     """Convert hexadecimal color to RGBA format.
@@ -30,32 +42,138 @@ def hex2rgba(hexa):
     return (r, g, b, a)
 
 
-def random_seed(seed_min=0, seed_max=2**32):
-    """Get a random seed between in [seed_min, seed_max] range.
-
-    Args:
-        seed_min (int, optional): Minimum value. Defaults to 0.
-        seed_max (int, optional): Maximum value. Defaults to 2**32.
+def random_seed():
+    """Get a random 32 bits seed in [0, 2**32 - 1] range.
 
     Returns:
         int: Random seed.
     """
-    return random.randint(int(seed_min), int(seed_max))
+    return random.getrandbits(32)
 
 
-def get_latitude_grid(height, width):
-    """Return latitudes as a map grid.
+def get_latitudes(height):
+    """Return latitudes of each map row.
 
     Args:
         height (int): Map height.
-        width (int): Map width.
 
     Returns:
-        np.array: Numpy array of latitudes of shape (height, width).
+        np.array: Numpy array of latitudes of shape (height,).
     """
     # array 1D of [0, 1, ..., height-1]
     i = np.arange(height)
     # compute latitudes: top rows = 90, middel = 0, bottom rows = -90
-    lat_1d = 90.0 - (i / (height - 1)) * 180.0
-    # tile it as a grid
-    return np.tile(lat_1d[:, None], (1, width))
+    return 90.0 - (i / (height - 1)) * 180.0
+
+
+def perspective_matrix(fovy, aspect, near, far):
+    """Return a perspective projection matrix, equivalent to gluPerspective.
+
+    Args:
+        fovy (float): Vertical field of view (degrees).
+        aspect (float): Aspect ratio (width / height).
+        near (float): Distance to the near clipping plane.
+        far (float): Distance to the far clipping plane.
+
+    Returns:
+        np.array: Float32 projection matrix of shape (4, 4).
+    """
+    f = 1.0 / np.tan(np.radians(fovy) / 2.0)
+
+    return np.array(
+        [
+            [f / aspect, 0.0, 0.0, 0.0],
+            [0.0, f, 0.0, 0.0],
+            [0.0, 0.0, (far + near) / (near - far), 2.0 * far * near / (near - far)],
+            [0.0, 0.0, -1.0, 0.0],
+        ],
+        dtype=np.float32,
+    )
+
+
+def look_at_matrix(eye, center, up):
+    """Return a view matrix, equivalent to gluLookAt.
+
+    Args:
+        eye (list): Coordinates of the camera position.
+        center (list): Coordinates of the point the camera is looking at.
+        up (list): Components of the up vector to define camera orientation.
+
+    Returns:
+        np.array: Float32 view matrix of shape (4, 4).
+    """
+    eye = np.asarray(eye, dtype=np.float64)
+
+    # camera basis: forward, side (right) and recomputed up vectors
+    forward = np.asarray(center, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+
+    # rotate world into camera basis then translate by -eye
+    view = np.eye(4, dtype=np.float32)
+    view[0, :3] = side
+    view[1, :3] = up
+    view[2, :3] = -forward
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view
+
+
+def disk_cache(func):
+    """Decorator caching the np.array returned by a function as a .npy file, keyed by its arguments.
+
+    Calls without seed (random output) are not cached. Caching is best effort: unreadable entries are regenerated
+    and failed saves are ignored.
+
+    Args:
+        func (callable): Function with a seed argument returning a np.array.
+
+    Returns:
+        callable: Wrapped function.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        params = signature.bind(*args, **kwargs)
+        params.apply_defaults()
+
+        if params.arguments.get("seed") is None:
+            return func(*args, **kwargs)
+
+        # hash cache version, function name and parameters to get the cache file name
+        key = json.dumps([_cache_version, func.__module__, func.__qualname__, params.arguments], sort_keys=True)
+        path = os.path.join(_cache_dir, f"{hashlib.sha1(key.encode()).hexdigest()}.npy")
+
+        # cache is best effort: an unreadable entry is a miss and is removed so it is rebuilt
+        if os.path.isfile(path):
+            try:
+                return np.load(path)
+            except (OSError, ValueError, EOFError):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        result = func(*args, **kwargs)
+
+        # write to a unique temporary file then rename it, so concurrent writers never interleave and readers
+        # only ever see complete entries, a failed save (read-only or full disk) leaves the result usable
+        tmp_path = None
+        try:
+            os.makedirs(_cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=_cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, result)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+        return result
+
+    return wrapper